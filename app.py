@@ -1,35 +1,75 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from zoneinfo import ZoneInfo
-from urllib.parse import quote
+from urllib.parse import quote, urlencode
 import re
 import unicodedata
 import os
+import hashlib
+from io import BytesIO
+from functools import lru_cache
+
+from src.dashboard import build_dashboard_frames, prepare_dashboard_base
+from src.loaders import load_masters_repo
+from src.normalize import normalize_products, summarize_replenishment
+from src.parsers import parse_avantio_entradas, parse_odoo_stock
 
 ORIGIN_LAT = 39.45702028460933
 ORIGIN_LNG = -0.38498336081567713
+_ORIGIN_COORD = f"{ORIGIN_LAT:.8f},{ORIGIN_LNG:.8f}"
+# Parte fija de las URLs de ruta (api + origen) codificada una sola vez
+_GMAPS_DIR_PREFIX = "https://www.google.com/maps/dir/?" + urlencode(
+    [("api", "1"), ("origin", _ORIGIN_COORD)], quote_via=quote
+)
 
 # ✅ NUEVO CRITERIO: 🟢 solo si la última limpieza es EXACTAMENTE el día foco (mismo día de la fila)
 # (lo dejamos como “lookback” por compatibilidad, pero 0 = mismo día)
 CLEAN_READY_LOOKBACK_DAYS = 0
 
+# Apartamentos con check-in presencial
+PRESENCIAL_APTS = {"SERRANOS"}
+
 
 # =========================
 # Apartamento key (matching robusto)
 # =========================
+_WS_RX = re.compile(r"\s+")
+_LEADING_ZEROS_RX = re.compile(r"\b0+(\d)")  # "APOLO 029" -> "APOLO 29"
+_COMBINING_RX = re.compile(r"[\u0300-\u036f]")  # tildes tras NFD
+
+
+@lru_cache(maxsize=4096)
 def _apt_key(s: str) -> str:
     if s is None:
         return ""
     s = str(s).strip()
     if not s:
         return ""
-    s = unicodedata.normalize("NFD", s)
-    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")  # quita tildes
-    s = re.sub(r"\s+", " ", s)
-    s = re.sub(r"\b0+(\d)", r"\1", s)  # "APOLO 029" -> "APOLO 29"
+    if not s.isascii():  # cabeceras/nombres ASCII: NFD no cambia nada
+        s = unicodedata.normalize("NFD", s)
+        s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")  # quita tildes
+    s = _WS_RX.sub(" ", s)
+    s = _LEADING_ZEROS_RX.sub(r"\1", s)
     return s.upper().strip()
 
 
+def _apt_key_series(s: pd.Series) -> pd.Series:
+    """
+    Versión vectorizada de _apt_key (sin llamada Python por fila).
+    Nulos -> "" (a diferencia de _apt_key, que da "NAN" para un NaN).
+    Solo quita las marcas combinantes U+0300–U+036F (tildes latinas), no todas las Mn.
+    """
+    out = s.astype(object).where(s.notna(), "").astype(str).str.strip()
+    out = out.str.normalize("NFD").str.replace(_COMBINING_RX, "", regex=True)
+    out = out.str.replace(_WS_RX, " ", regex=True)
+    out = out.str.replace(_LEADING_ZEROS_RX, r"\1", regex=True)
+    return out.str.upper().str.strip()
+
+
+PRESENCIAL_KEYS = frozenset(_apt_key(x) for x in PRESENCIAL_APTS)
+
+
 # =========================
 # Excel-letter column helper
 # =========================
@@ -255,11 +295,11 @@ def load_whatsapp_master_from_data() -> pd.DataFrame:
     except Exception:
         return pd.DataFrame()
 
-    df.columns = [str(c).strip() for c in df.columns]
+    df.columns = list(map(str.strip, map(str, df.columns)))
 
     ren = {}
     for c in df.columns:
-        cl = str(c).strip().lower()
+        cl = c.lower()
 
         if cl in {"apartamentos", "apartamento", "apartment"}:
             ren[c] = "Apartamentos"
@@ -300,7 +340,7 @@ def load_whatsapp_master_from_data() -> pd.DataFrame:
         return pd.DataFrame()
 
     df["Apartamentos"] = df["Apartamentos"].astype(str).str.strip()
-    df["APARTAMENTO_KEY"] = df["Apartamentos"].map(_apt_key)
+    df["APARTAMENTO_KEY"] = _apt_key_series(df["Apartamentos"])
 
     if "ACTIVO" not in df.columns:
         df["ACTIVO"] = 1
@@ -324,7 +364,8 @@ def load_whatsapp_master_from_data() -> pd.DataFrame:
 
     df["ACTIVO"] = pd.to_numeric(df["ACTIVO"], errors="coerce").fillna(0).astype(int)
 
-    df = df[df["APARTAMENTO_KEY"].astype(str).str.strip().ne("")].copy()
+    # _apt_key_series ya devuelve texto sin espacios ni nulos: basta comparar con ""
+    df = df[df["APARTAMENTO_KEY"].ne("")].copy()
     df = df.drop_duplicates(subset=["APARTAMENTO_KEY"], keep="first").reset_index(drop=True)
     return df
 
@@ -343,7 +384,7 @@ def add_whatsapp_links_to_df(df: pd.DataFrame, wa_master: pd.DataFrame) -> pd.Da
     out = df.copy()
 
     if "APARTAMENTO_KEY" not in out.columns and "APARTAMENTO" in out.columns:
-        out["APARTAMENTO_KEY"] = out["APARTAMENTO"].map(_apt_key)
+        out["APARTAMENTO_KEY"] = _apt_key_series(out["APARTAMENTO"])
 
     # columnas vacías si no hay master
     if wa_master is None or wa_master.empty:
@@ -476,12 +517,13 @@ def build_cleaning_master_from_sheet(sheet_df: pd.DataFrame) -> pd.DataFrame:
 
     tmp = sheet_df[[ts_col, apt_col]].copy()
     tmp = tmp.rename(columns={ts_col: "TS_RAW", apt_col: "APT_RAW"})
-    tmp["APARTAMENTO_KEY"] = tmp["APT_RAW"].map(_apt_key)
+    tmp["APARTAMENTO_KEY"] = _apt_key_series(tmp["APT_RAW"])
 
     # dayfirst=True por formato dd/mm/yyyy HH:MM:SS
     tmp["LAST_CLEAN_TS"] = pd.to_datetime(tmp["TS_RAW"], errors="coerce", dayfirst=True)
-    tmp = tmp.dropna(subset=["APARTAMENTO_KEY", "LAST_CLEAN_TS"]).copy()
-    tmp = tmp[tmp["APARTAMENTO_KEY"].astype(str).str.strip().ne("")].copy()
+    # solo lectura hasta el groupby: filtros sin copias intermedias
+    tmp = tmp.dropna(subset=["APARTAMENTO_KEY", "LAST_CLEAN_TS"])
+    tmp = tmp[tmp["APARTAMENTO_KEY"].ne("")]
 
     master = (
         tmp.groupby("APARTAMENTO_KEY", as_index=False)["LAST_CLEAN_TS"]
@@ -508,7 +550,7 @@ def add_cleaning_ready_columns(
     out = oper_df.copy()
 
     if "APARTAMENTO_KEY" not in out.columns and "APARTAMENTO" in out.columns:
-        out["APARTAMENTO_KEY"] = out["APARTAMENTO"].map(_apt_key)
+        out["APARTAMENTO_KEY"] = _apt_key_series(out["APARTAMENTO"])
 
     if cleaning_master is None or cleaning_master.empty:
         out["🧹"] = "🟠"
@@ -533,42 +575,50 @@ def add_cleaning_ready_columns(
 # =========================
 # Google Maps helpers
 # =========================
-def _coord_str(lat, lng):
-    try:
-        return f"{float(lat):.8f},{float(lng):.8f}"
-    except Exception:
-        return None
+def _coord_series(lat: pd.Series, lng: pd.Series) -> pd.Series:
+    """
+    "lat,lng" con 8 decimales para toda la columna, None si falta alguna.
+    """
+    lat = pd.to_numeric(lat, errors="coerce")
+    lng = pd.to_numeric(lng, errors="coerce")
+    ok = lat.notna() & lng.notna()
+    coord = pd.Series(None, index=lat.index, dtype="object")
+    if ok.any():
+        coord[ok] = lat[ok].map("{:.8f}".format) + "," + lng[ok].map("{:.8f}".format)
+    return coord
 
 
 def build_gmaps_directions_url(coords, travelmode="walking", return_to_base=False):
-    clean = []
-    seen = set()
-    for c in coords:
-        if isinstance(c, str) and "," in c and c not in seen:
-            seen.add(c)
-            clean.append(c)
+    # dedup preservando orden
+    clean = list(dict.fromkeys(c for c in coords if isinstance(c, str) and "," in c))
 
     if not clean:
         return None
 
-    origin = f"{ORIGIN_LAT:.8f},{ORIGIN_LNG:.8f}"
-
     if return_to_base:
-        destination = origin
+        destination = _ORIGIN_COORD
         waypoints = clean
     else:
         destination = clean[-1]
         waypoints = clean[:-1]
 
-    wp = "|".join(waypoints)
+    params = [("destination", destination)]
+    if waypoints:
+        params.append(("waypoints", "|".join(waypoints)))
+    params.append(("travelmode", travelmode))
+    return _GMAPS_DIR_PREFIX + "&" + urlencode(params, quote_via=quote)
+
+
+_EMPTY_TXT = ("", "nan", "none")
 
-    url = "https://www.google.com/maps/dir/?api=1"
-    url += f"&origin={quote(origin)}"
-    url += f"&destination={quote(destination)}"
-    if wp:
-        url += f"&waypoints={quote(wp)}"
-    url += f"&travelmode={quote(travelmode)}"
-    return url
+
+def _has_any_text(df: pd.DataFrame, cols: list[str]) -> pd.Series:
+    """Máscara por fila: alguna de las columnas trae texto real (no vacío / nan / none)."""
+    mask = pd.Series(False, index=df.index)
+    for c in cols:
+        txt = df[c].astype(str).str.strip().str.lower()
+        mask |= ~txt.isin(_EMPTY_TXT)
+    return mask
 
 
 def chunk_list(xs, n):
@@ -576,53 +626,125 @@ def chunk_list(xs, n):
         yield xs[i : i + n]
 
 
+def _lexsort_order(df: pd.DataFrame, cols: list[str]) -> np.ndarray:
+    """
+    Orden posicional ascendente y estable por varias columnas (nulos al final),
+    equivalente a sort_values(cols, kind="stable") pero sobre códigos enteros.
+    """
+    keys = []
+    for c in reversed(cols):  # lexsort: la última clave es la principal
+        codes, uniques = pd.factorize(df[c], sort=True)
+        codes[codes < 0] = len(uniques)
+        keys.append(codes)
+    return np.lexsort(keys)
+
+
+def _contiguous_groups(df: pd.DataFrame, cols: list[str]):
+    """
+    Sobre un DataFrame ya ordenado por cols, itera (claves, tramo) por cada
+    racha consecutiva con las mismas claves (nulos incluidos) usando cortes
+    iloc, sin pasar por groupby.
+    """
+    n = len(df)
+    if n == 0:
+        return
+    change = np.zeros(n, dtype=bool)
+    change[0] = True
+    for c in cols:
+        codes = pd.factorize(df[c])[0]
+        change[1:] |= codes[1:] != codes[:-1]
+    starts = np.flatnonzero(change)
+    for a, b in zip(starts, np.r_[starts[1:], n]):
+        part = df.iloc[a:b]
+        yield tuple(part[c].iat[0] for c in cols), part
+
+
+def _sum_by_keys(df: pd.DataFrame, keys: list[str], value: str) -> pd.DataFrame:
+    """
+    groupby(keys, as_index=False)[value].sum() por códigos enteros: una clave
+    compuesta, un argsort estable y np.add.reduceat por tramos. Mismo orden
+    (claves ascendentes) y mismo descarte de claves nulas que el groupby.
+    """
+    codes, uniques = [], []
+    for c in keys:
+        k, u = pd.factorize(df[c], sort=True)
+        codes.append(k.astype(np.int64))
+        uniques.append(u)
+
+    valid = np.logical_and.reduce([k >= 0 for k in codes])
+    key = np.zeros(int(valid.sum()), dtype=np.int64)
+    for k, u in zip(codes, uniques):
+        key = key * len(u) + k[valid]
+
+    if key.size == 0:
+        return df.iloc[0:0][keys + [value]].reset_index(drop=True)
+
+    order = np.argsort(key, kind="stable")
+    key_sorted = key[order]
+    starts = np.flatnonzero(np.r_[True, key_sorted[1:] != key_sorted[:-1]])
+    sums = np.add.reduceat(df[value].to_numpy()[valid][order], starts)
+
+    out = {}
+    rest = key_sorted[starts]
+    for c, u in reversed(list(zip(keys, uniques))):
+        rest, pos = np.divmod(rest, len(u))
+        out[c] = u.take(pos)
+    out = {c: out[c] for c in keys}
+    out[value] = sums
+    return pd.DataFrame(out)
+
+
 # =========================
 # Styles
 # =========================
+_ESTADO_COLORS = {
+    "ENTRADA+SALIDA": "#FFF3BF",
+    "ENTRADA": "#D3F9D8",
+    "SALIDA": "#FFE8CC",
+    "OCUPADO": "#E7F5FF",
+    "VACIO": "#F1F3F5",
+}
+_ESTADO_CSS = {k: f"background-color: {v}" for k, v in _ESTADO_COLORS.items()}
+
+
 def _style_operativa(df: pd.DataFrame):
-    colors = {
-        "ENTRADA+SALIDA": "#FFF3BF",
-        "ENTRADA": "#D3F9D8",
-        "SALIDA": "#FFE8CC",
-        "OCUPADO": "#E7F5FF",
-        "VACIO": "#F1F3F5",
-    }
+    # Matriz CSS completa de una vez (sin callback Python por fila); con Estado
+    # category el map solo recorre las categorías
+    if "Estado" in df.columns:
+        css = df["Estado"].map(_ESTADO_CSS).astype(object).fillna("")
+    else:
+        css = pd.Series("", index=df.index)
 
-    def row_style(row):
-        bg = colors.get(str(row.get("Estado", "")), "")
-        if bg:
-            return [f"background-color: {bg}"] * len(row)
-        return [""] * len(row)
+    css_col = css.to_numpy(dtype=object)[:, None]
 
-    return df.style.apply(row_style, axis=1)
+    def frame_style(d: pd.DataFrame) -> pd.DataFrame:
+        return pd.DataFrame(np.repeat(css_col, d.shape[1], axis=1), index=d.index, columns=d.columns)
+
+    return df.style.apply(frame_style, axis=None)
 
 
 # =========================
 # Render helper
 # =========================
-def _render_operativa_table(df: pd.DataFrame, key: str, styled: bool = True):
-    if df is None or df.empty:
-        st.info("Sin resultados.")
-        return
-
-    view = df.copy()
+def _operativa_column_config(columns) -> dict:
+    """column_config de las tablas operativas; depende solo de las columnas presentes."""
     colcfg = {}
 
     # Limpieza status
-    if "🧹" in view.columns:
+    if "🧹" in columns:
         colcfg["🧹"] = st.column_config.TextColumn("🧹", width="small", max_chars=2)
-    if "Última limp" in view.columns:
+    if "Última limp" in columns:
         colcfg["Última limp"] = st.column_config.TextColumn("Última limp", width="small", max_chars=50)
 
     # Links (renombrados)
-    if "PRIMER_ES_LINK" in view.columns:
+    if "PRIMER_ES_LINK" in columns:
         colcfg["PRIMER_ES_LINK"] = st.column_config.LinkColumn(
             "1 MENSAJE ES",
             help="Primer mensaje (ES) con saludo + nombre",
             display_text="Abrir",
             width="small",
         )
-    if "PRIMER_EN_LINK" in view.columns:
+    if "PRIMER_EN_LINK" in columns:
         colcfg["PRIMER_EN_LINK"] = st.column_config.LinkColumn(
             "1 MENSAJE EN",
             help="First message (EN) with greeting + name",
@@ -630,14 +752,14 @@ def _render_operativa_table(df: pd.DataFrame, key: str, styled: bool = True):
             width="small",
         )
 
-    if "WA_ES_LINK" in view.columns:
+    if "WA_ES_LINK" in columns:
         colcfg["WA_ES_LINK"] = st.column_config.LinkColumn(
             "ENTRADA ES",
             help="Instrucciones entrada (ES) con saludo + nombre + links",
             display_text="Abrir",
             width="small",
         )
-    if "WA_EN_LINK" in view.columns:
+    if "WA_EN_LINK" in columns:
         colcfg["WA_EN_LINK"] = st.column_config.LinkColumn(
             "ENTRADA EN",
             help="Entry instructions (EN) with greeting + name + links",
@@ -645,14 +767,14 @@ def _render_operativa_table(df: pd.DataFrame, key: str, styled: bool = True):
             width="small",
         )
 
-    if "CONFIRM_ES_LINK" in view.columns:
+    if "CONFIRM_ES_LINK" in columns:
         colcfg["CONFIRM_ES_LINK"] = st.column_config.LinkColumn(
             "CONFIRMACION ES",
             help="Mensaje confirmación (ES) 1 día antes",
             display_text="Abrir",
             width="small",
         )
-    if "CONFIRM_EN_LINK" in view.columns:
+    if "CONFIRM_EN_LINK" in columns:
         colcfg["CONFIRM_EN_LINK"] = st.column_config.LinkColumn(
             "CONFIRMACION EN",
             help="Confirmation message (EN) 1 day before",
@@ -660,14 +782,14 @@ def _render_operativa_table(df: pd.DataFrame, key: str, styled: bool = True):
             width="small",
         )
 
-    if "RESEÑAS_ES_LINK" in view.columns:
+    if "RESEÑAS_ES_LINK" in columns:
         colcfg["RESEÑAS_ES_LINK"] = st.column_config.LinkColumn(
             "RESEÑAS ES",
             help="Solicitar reseña (ES)",
             display_text="Abrir",
             width="small",
         )
-    if "RESEÑAS_EN_LINK" in view.columns:
+    if "RESEÑAS_EN_LINK" in columns:
         colcfg["RESEÑAS_EN_LINK"] = st.column_config.LinkColumn(
             "RESEÑAS EN",
             help="Request review (EN)",
@@ -676,15 +798,27 @@ def _render_operativa_table(df: pd.DataFrame, key: str, styled: bool = True):
         )
 
     for c in ["Lista_reponer", "Completar con", "Producto", "Cliente"]:
-        if c in view.columns:
+        if c in columns:
             colcfg[c] = st.column_config.TextColumn(c, width="large", max_chars=10000)
 
-    if "APARTAMENTO" in view.columns:
+    if "APARTAMENTO" in columns:
         colcfg["APARTAMENTO"] = st.column_config.TextColumn("APARTAMENTO", width="medium", max_chars=5000)
 
-    if "Teléfono" in view.columns:
+    if "Teléfono" in columns:
         colcfg["Teléfono"] = st.column_config.TextColumn("Teléfono", width="medium", max_chars=200)
 
+    return colcfg
+
+
+def _render_operativa_table(df: pd.DataFrame, key: str, styled: bool = True, colcfg: dict | None = None):
+    if df is None or df.empty:
+        st.info("Sin resultados.")
+        return
+
+    view = df
+    if colcfg is None:
+        colcfg = _operativa_column_config(view.columns)
+
     if styled:
         st.dataframe(_style_operativa(view), use_container_width=True, height="content", column_config=colcfg)
     else:
@@ -694,66 +828,52 @@ def _render_operativa_table(df: pd.DataFrame, key: str, styled: bool = True):
 # =========================
 # Reposición parsing
 # =========================
-_ITEM_RX = re.compile(r"^\s*(.*?)\s*x\s*([0-9]+)\s*$", re.IGNORECASE)
+# Sobre texto ya strip() (el único llamador lo hace): sin \s* en los extremos que se
+# solape con el nombre, el tiempo es lineal incluso con muchos espacios seguidos
+_ITEM_RX = re.compile(r"^((?:.*\S)?)\s*x\s*([0-9]+)$", re.IGNORECASE)
 
 
-def parse_lista_reponer(s: str):
-    if s is None:
-        return []
-    txt = str(s).strip()
-    if not txt:
-        return []
-    parts = [p.strip() for p in txt.split(",") if p.strip()]
-    out = []
-    for p in parts:
-        m = _ITEM_RX.match(p)
-        if m:
-            name = m.group(1).strip()
-            qty = int(m.group(2))
-            if name:
-                out.append((name, qty))
-        else:
-            out.append((p, 1))
-    return out
+def _explode_lista_reponer(df: pd.DataFrame, col: str) -> pd.DataFrame:
+    """
+    Parsea la lista de reposición de toda la columna a la vez:
+    "Gel x2, Champú" -> una fila por producto (Producto, Cantidad; sin "xN" cuenta 1).
+    """
+    # Filas sin texto fuera antes del split/explode: la mayoría de días no hay reposición
+    txt = df[col].fillna("").astype(str)
+    has_txt = txt.str.len().gt(0)
+    long = df.loc[has_txt, ["Día", "ZONA", "APARTAMENTO"]].assign(item=txt[has_txt].str.split(","))
+    long = long.explode("item")
+    long["item"] = long["item"].fillna("").astype(str).str.strip()  # _ITEM_RX espera texto strip()
+    long = long[long["item"].ne("")]
 
+    ext = long["item"].str.extract(_ITEM_RX)
+    matched = ext[0].notna()
+    long["Producto"] = ext[0].str.strip().where(matched, long["item"])
+    long["Cantidad"] = pd.to_numeric(ext[1], errors="coerce").fillna(1).astype(int)
+    long = long[~matched | long["Producto"].ne("")]
+
+    long["Fuente"] = col
+    return long.drop(columns=["item"])
 
-def build_sugerencia_df(operativa: pd.DataFrame, zonas_sel: list[str], include_completar: bool = False):
-    df = operativa.copy()
-    df = df[df["Estado"].isin(["ENTRADA", "ENTRADA+SALIDA", "VACIO"])].copy()
 
+def build_sugerencia_df(operativa: pd.DataFrame, zonas_sel: list[str], include_completar: bool = False):
+    mask = operativa["Estado"].isin(["ENTRADA", "ENTRADA+SALIDA", "VACIO"])
     if zonas_sel:
-        df = df[df["ZONA"].isin(zonas_sel)].copy()
+        mask &= operativa["ZONA"].isin(zonas_sel)
+    df = operativa[mask]
 
     cols = ["Lista_reponer"]
     if include_completar and "Completar con" in df.columns:
         cols.append("Completar con")
 
-    rows = []
-    for _, r in df.iterrows():
-        for col in cols:
-            txt = r.get(col, "")
-            if str(txt).strip() == "":
-                continue
-            items = parse_lista_reponer(txt)
-            for prod, qty in items:
-                rows.append(
-                    {
-                        "Día": r.get("Día"),
-                        "ZONA": r.get("ZONA"),
-                        "APARTAMENTO": r.get("APARTAMENTO"),
-                        "Producto": prod,
-                        "Cantidad": int(qty),
-                        "Fuente": col,
-                    }
-                )
-
-    items_df = pd.DataFrame(rows)
+    items_df = pd.concat([_explode_lista_reponer(df, col) for col in cols], ignore_index=True)
+    items_df["Fuente"] = items_df["Fuente"].astype("category")
     if items_df.empty:
         totals_df = pd.DataFrame(columns=["Producto", "Total"])
         return items_df, totals_df
 
     totals_df = (
-        items_df.groupby("Producto", as_index=False)["Cantidad"]
+        items_df.groupby("Producto", as_index=False, sort=False)["Cantidad"]
         .sum()
         .rename(columns={"Cantidad": "Total"})
         .sort_values(["Total", "Producto"], ascending=[False, True])
@@ -873,8 +993,10 @@ def enrich_operativa_with_guest_fields(operativa_df: pd.DataFrame, avantio_df: p
     if "APARTAMENTO" not in av.columns:
         return out
 
-    av["APARTAMENTO"] = av["APARTAMENTO"].astype(str).str.strip()
-    av["APARTAMENTO_KEY"] = av["APARTAMENTO"].map(_apt_key)
+    # El pipeline ya entrega APARTAMENTO normalizado + APARTAMENTO_KEY: no se rehace en cada rerun
+    if "APARTAMENTO_KEY" not in av.columns:
+        av["APARTAMENTO"] = av["APARTAMENTO"].astype(str).str.strip()
+        av["APARTAMENTO_KEY"] = _apt_key_series(av["APARTAMENTO"])
 
     # Detección robusta por nombre de columna
     col_ad = _find_col_contains(av, ["adult"])
@@ -984,7 +1106,7 @@ def enrich_operativa_with_guest_fields(operativa_df: pd.DataFrame, avantio_df: p
     })
 
     if "APARTAMENTO_KEY" not in out.columns:
-        out["APARTAMENTO_KEY"] = out["APARTAMENTO"].map(_apt_key)
+        out["APARTAMENTO_KEY"] = _apt_key_series(out["APARTAMENTO"])
 
     out["Día"] = pd.to_datetime(out["Día"], errors="coerce").dt.date
 
@@ -1031,18 +1153,302 @@ def enrich_operativa_with_guest_fields(operativa_df: pd.DataFrame, avantio_df: p
     return out
 
 
-def main():
-    from src.loaders import load_masters_repo
-    from src.parsers import parse_avantio_entradas, parse_odoo_stock
-    from src.normalize import normalize_products, summarize_replenishment
-    from src.dashboard import build_dashboard_frames
-    from src.gsheets import read_sheet_df
+# =========================
+# Texto Arrow (string[pyarrow]) para claves de merge/groupby
+# =========================
+try:
+    import pyarrow  # noqa: F401  (dependencia de streamlit)
 
-    try:
-        from src.cleaning_last_report import build_last_report_view
-    except Exception:
-        from src.parsers.cleaning_last_report import build_last_report_view
+    _ARROW_STR = pd.StringDtype("pyarrow")
+except Exception:
+    _ARROW_STR = None
+
+_ARROW_STR_COLS = ("APARTAMENTO", "ALMACEN", "Producto")
+
+
+def _to_arrow_str(df: pd.DataFrame, cols=_ARROW_STR_COLS) -> pd.DataFrame:
+    """
+    Pasa columnas clave a string[pyarrow] (buffers UTF-8 contiguos + kernels Arrow).
+    Sin pyarrow, deja el DataFrame tal cual.
+    """
+    if _ARROW_STR is None:
+        return df
+    for c in cols:
+        if c in df.columns:
+            df[c] = df[c].astype(_ARROW_STR)
+    return df
+
+
+def _norm_key(s: pd.Series) -> pd.Series:
+    """
+    Equivale a s.astype(str).str.strip(), pero el strip corre en Arrow
+    (utf8_trim_whitespace) y la columna queda ya como string[pyarrow].
+    """
+    if _ARROW_STR is None:
+        return s.astype(str).str.strip()
+    if not isinstance(s.dtype, pd.StringDtype):
+        # solo objeto/numérico necesita el paso por str; texto ya tipado va directo a Arrow
+        s = s.astype(str)
+    return s.astype(_ARROW_STR).str.strip()
+
+
+# =========================
+# Cache: maestros + archivos diarios (Streamlit re-ejecuta el script en cada interacción)
+# =========================
+@st.cache_resource(show_spinner=False)
+def _cached_masters() -> dict:
+    return load_masters_repo()
+
+
+@st.cache_resource(show_spinner=False)
+def _cached_whatsapp_master() -> pd.DataFrame:
+    return load_whatsapp_master_from_data()
+
+
+@st.cache_data(show_spinner=False)
+def _cached_apt_options() -> list[str]:
+    """
+    Opciones del buscador de apartamentos (ordenadas, sin vacíos). El filtrado
+    por texto lo hace el propio multiselect en el navegador.
+    """
+    masters = _cached_masters()
+    apt = masters.get("apt_almacen")
+    if apt is None or "APARTAMENTO" not in apt.columns:
+        return []
+
+    names = apt["APARTAMENTO"].dropna().astype(str).str.strip()
+    names = names[names.ne("") & ~names.str.lower().isin(["nan", "none"])]
+    # np.unique: ordena y quita duplicados en una pasada
+    return np.unique(names.to_numpy(dtype=str)).tolist()
+
+
+@st.cache_data(show_spinner=False)
+def _cached_zonas_all() -> list[str]:
+    """
+    Opciones del selector de ZONAS (ordenadas, sin vacíos); el maestro no cambia entre reruns.
+    """
+    masters = _cached_masters()
+    zonas = masters.get("zonas")
+    if zonas is None or "ZONA" not in zonas.columns:
+        return []
+
+    names = zonas["ZONA"].dropna().astype(str).str.strip()
+    names = names[names.ne("") & ~names.str.lower().isin(["nan", "none"])]
+    return np.unique(names.to_numpy(dtype=str)).tolist()
+
+
+def _file_from_bytes(file_bytes: bytes, name: str) -> BytesIO:
+    """
+    Los parsers esperan un objeto tipo UploadedFile (getvalue + name).
+    """
+    buf = BytesIO(file_bytes)
+    buf.name = name
+    return buf
+
+
+def _upload_key(f) -> tuple:
+    """
+    Identidad barata de un archivo subido (sin hashear su contenido).
+    """
+    return (getattr(f, "file_id", None), f.name, getattr(f, "size", None))
+
+
+def _uploads_digest(*blobs: bytes) -> str:
+    """
+    Huella blake2b del contenido subido, calculada una sola vez por cambio de
+    archivos. Las cachés la reciben como clave y los bytes como argumento
+    _privado (Streamlit no lo hashea), en vez de re-hashear los MB en cada capa.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for b in blobs:
+        h.update(len(b).to_bytes(8, "little"))
+        h.update(b)
+    return h.hexdigest()
+
+
+# Solo en memoria: las reservas llevan nombres y teléfonos de huéspedes y Streamlit
+# nunca borra las entradas persist="disk" (ni ttl ni max_entries aplican al disco)
+@st.cache_data(show_spinner=False)
+def _cached_parse_uploads(
+    uploads_key: str,
+    _avantio_bytes: bytes,
+    avantio_name: str,
+    _odoo_bytes: bytes,
+    odoo_name: str,
+):
+    """
+    Parsea Avantio y Odoo uno tras otro: Avantio va por openpyxl / motor python
+    (Python puro, retiene el GIL), así que en hilos apenas se solaparían.
+    Devuelve (avantio_df, odoo_df).
+    """
+    avantio_df = parse_avantio_entradas(_file_from_bytes(_avantio_bytes, avantio_name))
+    odoo_df = parse_odoo_stock(_file_from_bytes(_odoo_bytes, odoo_name))
+    return avantio_df, odoo_df
+
+
+@st.cache_data(show_spinner=False)
+def _cached_ap_map() -> tuple[pd.DataFrame, dict]:
+    """
+    APARTAMENTO -> ALMACEN + LAT/LNG desde el maestro (solo depende de data/).
+    Devuelve (ap_map, coord_map); coord_map es APARTAMENTO -> "lat,lng".
+    """
+    masters = _cached_masters()
+    ap_map = masters["apt_almacen"].copy()
+
+    for c in ["LAT", "LNG"]:
+        if c not in ap_map.columns:
+            ap_map[c] = pd.NA
+
+    if "Localizacion" in ap_map.columns:
+        miss = ap_map["LAT"].isna() | ap_map["LNG"].isna()
+        if miss.any():
+            # "lat, lng" -> corte por la primera coma sobre toda la columna (sin apply por fila)
+            # el loader ya deja Localizacion como texto strip(): sin cast ni strip aquí
+            loc = ap_map.loc[miss, "Localizacion"]
+            parts = loc.str.extract(r"^([^,]*),([\s\S]*)$")
+            ap_map.loc[miss, "LAT"] = pd.to_numeric(parts[0].str.strip(), errors="coerce")
+            ap_map.loc[miss, "LNG"] = pd.to_numeric(parts[1].str.strip(), errors="coerce")
+
+    # APARTAMENTO/ALMACEN ya vienen strip() del loader: aquí solo se pasan a Arrow
+    ap_map = ap_map[["APARTAMENTO", "ALMACEN", "LAT", "LNG"]].dropna(subset=["APARTAMENTO", "ALMACEN"]).drop_duplicates()
+    ap_map = _to_arrow_str(ap_map)
+
+    # Coordenadas formateadas una sola vez: la ruta las consulta por dict en vez de otro merge.
+    # Solo apartamentos con coordenadas: dict vacío = no hay ruta posible
+    ap_coord = ap_map.drop_duplicates(subset=["APARTAMENTO"])
+    coord = _coord_series(ap_coord["LAT"], ap_coord["LNG"])
+    ok = coord.notna()
+    coord_map = dict(zip(ap_coord.loc[ok, "APARTAMENTO"], coord[ok]))
+    return ap_map, coord_map
+
+
+@st.cache_data(show_spinner=False)
+def _cached_apt_lookup() -> pd.DataFrame:
+    """
+    zonas + cafe + ap_map combinados una vez, indexados por APARTAMENTO:
+    el pipeline hace un único join en vez de tres merges.
+    """
+    masters = _cached_masters()
+    tables = [
+        _to_arrow_str(t.copy(), ("APARTAMENTO",)).set_index("APARTAMENTO")
+        for t in (masters["zonas"], masters["cafe"], _cached_ap_map()[0])
+    ]
+    return tables[0].join(tables[1:], how="outer")
+
+
+@st.cache_data(show_spinner=False)
+def _cached_prepared(
+    uploads_key: str,
+    _avantio_bytes: bytes,
+    avantio_name: str,
+    _odoo_bytes: bytes,
+    odoo_name: str,
+):
+    """
+    Parte del pipeline que solo depende de los archivos subidos (cruce con
+    maestros + stock por almacén): cambiar periodo/modo no la recalcula.
+
+    Devuelve (avantio_df, rep_all, unclassified).
+    """
+    masters = _cached_masters()
+    avantio_df, odoo_df = _cached_parse_uploads(uploads_key, _avantio_bytes, avantio_name, _odoo_bytes, odoo_name)
+
+    if "Alojamiento" in avantio_df.columns:
+        avantio_df["APARTAMENTO"] = _norm_key(avantio_df["Alojamiento"])
+    else:
+        avantio_df["APARTAMENTO"] = _norm_key(avantio_df["APARTAMENTO"])
+
+    avantio_df = _to_arrow_str(avantio_df)
+    avantio_df["APARTAMENTO_KEY"] = _apt_key_series(avantio_df["APARTAMENTO"])
+
+    # Tabla zonas+cafe+almacen ya combinada (cacheada): con índice único se resuelven
+    # solo los apartamentos distintos y se expanden por código; si algún maestro
+    # repite apartamento, join (multiplica filas)
+    lookup = _cached_apt_lookup()
+    if lookup.index.is_unique:
+        codes, uniq = pd.factorize(avantio_df["APARTAMENTO"], use_na_sentinel=False)
+        cols = lookup.reindex(uniq).iloc[codes].set_axis(avantio_df.index)
+        avantio_df = pd.concat([avantio_df, cols], axis=1)
+    else:
+        avantio_df = avantio_df.join(lookup, on="APARTAMENTO")
+
+    odoo_norm = normalize_products(odoo_df)
+    if "Ubicación" in odoo_norm.columns:
+        odoo_norm = odoo_norm.rename(columns={"Ubicación": "ALMACEN"})
+    odoo_norm["ALMACEN"] = _norm_key(odoo_norm["ALMACEN"])
+    # AmenityKey también en Arrow: el groupby del stock agrega sin objetos Python
+    odoo_norm = _to_arrow_str(odoo_norm, _ARROW_STR_COLS + ("AmenityKey",))
+
+    # Partición única: sin AmenityKey -> "sin clasificar"; el resto se agrega
+    unclass_mask = odoo_norm["AmenityKey"].isna()
+    unclassified = odoo_norm.loc[unclass_mask, ["ALMACEN", "Producto", "Cantidad"]]
+    classified = odoo_norm.loc[~unclass_mask]
+
+    # Suma por (ALMACEN, AmenityKey) sobre códigos enteros ordenados
+    stock_by_alm = _sum_by_keys(classified, ["ALMACEN", "AmenityKey"], "Cantidad")
+    rep_all = summarize_replenishment(stock_by_alm, masters["thresholds"], objective="max", urgent_only=False)
+
+    return avantio_df, rep_all, unclassified
+
+
+@st.cache_data(show_spinner=False)
+def _cached_dashboard_base(
+    uploads_key: str,
+    _avantio_bytes: bytes,
+    avantio_name: str,
+    _odoo_bytes: bytes,
+    odoo_name: str,
+    mode: str,
+):
+    """
+    Reservas parseadas + base de apartamentos con listas de reposición:
+    depende de archivos y modo, no del periodo.
+    """
+    avantio_df, rep_all, _ = _cached_prepared(uploads_key, _avantio_bytes, avantio_name, _odoo_bytes, odoo_name)
+    urgent_only = mode.startswith("URGENTE")
+    rep = rep_all[rep_all["Bajo_minimo"]].copy() if urgent_only else rep_all
+    return prepare_dashboard_base(avantio_df, rep, rep_all_df=rep_all, urgent_only=urgent_only)
+
+
+@st.cache_data(show_spinner=False)
+def _cached_pipeline(
+    uploads_key: str,
+    _avantio_bytes: bytes,
+    avantio_name: str,
+    _odoo_bytes: bytes,
+    odoo_name: str,
+    period_start,
+    period_days: int,
+    mode: str,
+):
+    """
+    Reposición (según modo) + dashboard del periodo sobre _cached_prepared.
+    Solo depende de los archivos subidos y del periodo/modo: los filtros de
+    visualización (zonas, estados, buscador, KPI abierto) no lo recalculan.
+
+    Devuelve (dash, rep, coord_map, avantio_df, unclassified); coord_map es APARTAMENTO -> "lat,lng".
+    """
+    avantio_df, rep_all, unclassified = _cached_prepared(uploads_key, _avantio_bytes, avantio_name, _odoo_bytes, odoo_name)
+    coord_map = _cached_ap_map()[1]
+
+    urgent_only = mode.startswith("URGENTE")
+    rep = rep_all[rep_all["Bajo_minimo"]].copy() if urgent_only else rep_all
+
+    dash = build_dashboard_frames(
+        avantio_df=avantio_df,
+        replenishment_df=rep,
+        rep_all_df=rep_all,
+        urgent_only=urgent_only,
+        unclassified_products=unclassified,
+        period_start=period_start,
+        period_days=period_days,
+        prepared=_cached_dashboard_base(uploads_key, _avantio_bytes, avantio_name, _odoo_bytes, odoo_name, mode),
+    )
 
+    return dash, rep, coord_map, avantio_df, unclassified
+
+
+def main():
     st.set_page_config(page_title="Florit OPS – Operativa & Reposición", layout="wide")
     st.title("Florit OPS – Parte diario (Operativa + Reposición)")
 
@@ -1093,113 +1499,81 @@ def main():
         return_to_base = st.checkbox("Volver a Florit Flats al final", value=False)
 
     try:
-        masters = load_masters_repo()
+        masters = _cached_masters()
         st.sidebar.success("Maestros cargados ✅")
     except Exception as e:
         st.error("Fallo cargando maestros (data/).")
         st.exception(e)
         st.stop()
 
-    wa_master = load_whatsapp_master_from_data()
+    wa_master = _cached_whatsapp_master()
     if wa_master is None or wa_master.empty:
         st.sidebar.warning("WhatsApp maestro: no encontrado o vacío (data/whatsapp_instrucciones.xlsx).")
     else:
         st.sidebar.success(f"WhatsApp maestro cargado ✅ ({len(wa_master)} apts)")
 
-    zonas_all = (
-        masters["zonas"]["ZONA"].dropna().astype(str).str.strip().unique().tolist()
-        if "zonas" in masters and "ZONA" in masters["zonas"].columns
-        else []
-    )
-    zonas_all = sorted([z for z in zonas_all if z and z.lower() not in ["nan", "none"]])
+    zonas_all = _cached_zonas_all()
     zonas_sel = st.sidebar.multiselect("ZONAS (multiselección)", options=zonas_all, default=zonas_all)
 
     if not (avantio_file and odoo_file):
         st.info("Sube Avantio + Odoo para generar el parte operativo.")
         st.stop()
 
-    avantio_df = parse_avantio_entradas(avantio_file)
-    odoo_df = parse_odoo_stock(odoo_file)
-    if odoo_df is None or odoo_df.empty:
-        st.error("Odoo: no se pudieron leer datos del stock.quant.")
-        st.stop()
-
-    if "Alojamiento" in avantio_df.columns:
-        avantio_df["APARTAMENTO"] = avantio_df["Alojamiento"].astype(str).str.strip()
-    elif "APARTAMENTO" in avantio_df.columns:
-        avantio_df["APARTAMENTO"] = avantio_df["APARTAMENTO"].astype(str).str.strip()
-    else:
-        st.error("Avantio (Entradas): no encuentro columna 'Alojamiento' ni 'APARTAMENTO'.")
-        st.stop()
-
-    avantio_df["APARTAMENTO_KEY"] = avantio_df["APARTAMENTO"].map(_apt_key)
-
-    avantio_df = avantio_df.merge(masters["zonas"], on="APARTAMENTO", how="left")
-    avantio_df = avantio_df.merge(masters["cafe"], on="APARTAMENTO", how="left")
-
-    ap_map = masters["apt_almacen"].copy()
-    need = {"APARTAMENTO", "ALMACEN"}
-    if not need.issubset(set(ap_map.columns)):
-        st.error(f"Maestro apt_almacen: faltan columnas {need}. Columnas: {list(ap_map.columns)}")
-        st.stop()
-
-    for c in ["LAT", "LNG"]:
-        if c not in ap_map.columns:
-            ap_map[c] = pd.NA
-
-    if "Localizacion" in ap_map.columns:
-
-        def _split_loc(x):
-            s = str(x).strip()
-            if "," in s:
-                a, b = s.split(",", 1)
-                return a.strip(), b.strip()
-            return None, None
-
-        miss = ap_map["LAT"].isna() | ap_map["LNG"].isna()
-        if miss.any():
-            loc_pairs = ap_map.loc[miss, "Localizacion"].apply(_split_loc)
-            lat_vals = [float("nan") if (p is None or p[0] is None) else p[0] for p in loc_pairs]
-            lng_vals = [float("nan") if (p is None or p[1] is None) else p[1] for p in loc_pairs]
-            ap_map.loc[miss, "LAT"] = pd.to_numeric(lat_vals, errors="coerce")
-            ap_map.loc[miss, "LNG"] = pd.to_numeric(lng_vals, errors="coerce")
-
-    ap_map = ap_map[["APARTAMENTO", "ALMACEN", "LAT", "LNG"]].dropna(subset=["APARTAMENTO", "ALMACEN"]).drop_duplicates()
-    ap_map["APARTAMENTO"] = ap_map["APARTAMENTO"].astype(str).str.strip()
-    ap_map["ALMACEN"] = ap_map["ALMACEN"].astype(str).str.strip()
-
-    avantio_df = avantio_df.merge(ap_map, on="APARTAMENTO", how="left")
-
-    odoo_norm = normalize_products(odoo_df)
-    if "Ubicación" in odoo_norm.columns:
-        odoo_norm = odoo_norm.rename(columns={"Ubicación": "ALMACEN"})
-    odoo_norm["ALMACEN"] = odoo_norm["ALMACEN"].astype(str).str.strip()
-
-    stock_by_alm = (
-        odoo_norm.groupby(["ALMACEN", "AmenityKey"], as_index=False)["Cantidad"]
-        .sum()
-        .rename(columns={"Cantidad": "Cantidad"})
-    )
+    # Memo por sesión: si solo cambian widgets de visualización no se re-hashean los archivos
+    pipeline_key = (_upload_key(avantio_file), _upload_key(odoo_file), period_start, int(period_days), mode)
+    if st.session_state.get("_pipeline_key") != pipeline_key:
+        avantio_bytes = avantio_file.getvalue()
+        odoo_bytes = odoo_file.getvalue()
+        uploads_key = _uploads_digest(avantio_bytes, odoo_bytes)
+
+        # Sin reservas no hay operativa: los parsers lanzan ValueError con archivos vacíos
+        # (o sin el formato esperado) y se corta aquí, antes de cruces/reposición
+        try:
+            avantio_df, odoo_df = _cached_parse_uploads(
+                uploads_key, avantio_bytes, avantio_file.name, odoo_bytes, odoo_file.name
+            )
+        except ValueError as e:
+            st.warning(str(e))
+            st.stop()
+        if odoo_df is None or odoo_df.empty:
+            st.error("Odoo: no se pudieron leer datos del stock.quant.")
+            st.stop()
+
+        if "Alojamiento" not in avantio_df.columns and "APARTAMENTO" not in avantio_df.columns:
+            st.error("Avantio (Entradas): no encuentro columna 'Alojamiento' ni 'APARTAMENTO'.")
+            st.stop()
+
+        need = {"APARTAMENTO", "ALMACEN"}
+        if not need.issubset(set(masters["apt_almacen"].columns)):
+            st.error(f"Maestro apt_almacen: faltan columnas {need}. Columnas: {list(masters['apt_almacen'].columns)}")
+            st.stop()
+
+        st.session_state["_pipeline_out"] = _cached_pipeline(
+            uploads_key,
+            avantio_bytes,
+            avantio_file.name,
+            odoo_bytes,
+            odoo_file.name,
+            period_start,
+            int(period_days),
+            mode,
+        )
+        st.session_state["_pipeline_key"] = pipeline_key
 
+    dash, rep, coord_map, avantio_df, unclassified = st.session_state["_pipeline_out"]
     urgent_only = mode.startswith("URGENTE")
-    rep_all = summarize_replenishment(stock_by_alm, masters["thresholds"], objective="max", urgent_only=False)
-    rep = summarize_replenishment(stock_by_alm, masters["thresholds"], objective="max", urgent_only=urgent_only)
-
-    unclassified = odoo_norm[odoo_norm["AmenityKey"].isna()][["ALMACEN", "Producto", "Cantidad"]].copy()
-
-    dash = build_dashboard_frames(
-        avantio_df=avantio_df,
-        replenishment_df=rep,
-        rep_all_df=rep_all,
-        urgent_only=urgent_only,
-        unclassified_products=unclassified,
-        period_start=period_start,
-        period_days=period_days,
-    )
 
     # =========================
     # ✅ Cargar limpieza desde Google Sheet (cruda) y crear maestro de última limpieza
     # =========================
+    # Imports diferidos: sin archivos subidos el script se para antes y no los necesita
+    from src.gsheets import read_sheet_df
+
+    try:
+        from src.cleaning_last_report import build_last_report_view
+    except Exception:
+        from src.parsers.cleaning_last_report import build_last_report_view
+
     sheet_df = None
     last_view = pd.DataFrame()
     cleaning_master = pd.DataFrame()
@@ -1212,7 +1586,7 @@ def main():
             # Vista bonita (la que ya usabas en buscador)
             last_view = build_last_report_view(sheet_df)
             if last_view is not None and not last_view.empty and "Apartamento" in last_view.columns:
-                last_view["APARTAMENTO_KEY"] = last_view["Apartamento"].map(_apt_key)
+                last_view["APARTAMENTO_KEY"] = _apt_key_series(last_view["Apartamento"])
     except Exception as e:
         st.warning("No pude leer / procesar la Sheet de limpieza.")
         st.exception(e)
@@ -1227,25 +1601,23 @@ def main():
     today_real = pd.Timestamp.now(tz=tz).normalize().date()
     foco_day = pd.Timestamp(dash.get("period_start")).normalize().date()
 
-    oper_all = dash["operativa"].copy()
-    oper_all["APARTAMENTO_KEY"] = oper_all["APARTAMENTO"].map(_apt_key)
+    oper_all = dash["operativa"].assign(APARTAMENTO_KEY=lambda d: _apt_key_series(d["APARTAMENTO"]))
 
     oper_all = enrich_operativa_with_guest_fields(oper_all, avantio_df)
     oper_all = add_whatsapp_links_to_df(oper_all, wa_master)
     oper_all = add_cleaning_ready_columns(oper_all, cleaning_master, lookback_days=CLEAN_READY_LOOKBACK_DAYS)
 
-    oper_foco = oper_all[oper_all["Día"] == foco_day].copy()
-
-    presencial_set = {"SERRANOS"}
-    presencial_keys = {_apt_key(x) for x in presencial_set}
+    is_foco = oper_all["Día"] == foco_day
+    oper_foco = oper_all[is_foco]
 
     pres_df = oper_all[
-        (oper_all["Día"] == foco_day)
+        is_foco
         & (oper_all["Estado"].isin(["ENTRADA", "ENTRADA+SALIDA"]))
-        & (oper_all["APARTAMENTO_KEY"].isin(presencial_keys))
-    ].copy()
+        & (oper_all["APARTAMENTO_KEY"].isin(PRESENCIAL_KEYS))
+    ]
 
-    pres_label = "HOY" if foco_day == today_real else pd.to_datetime(foco_day).strftime("%d/%m/%Y")
+    foco_label = foco_day.strftime("%d/%m/%Y")
+    pres_label = "HOY" if foco_day == today_real else foco_label
 
     kpis = dash.get("kpis", {})
     st.divider()
@@ -1279,7 +1651,7 @@ def main():
             st.session_state["kpi_open"] = "vacios"
 
     with c6:
-        st.metric(f"Check-ins presenciales ({pres_label})", int(len(pres_df)))
+        st.metric(f"Check-ins presenciales ({pres_label})", len(pres_df))
         if st.button("Ver presenciales", key="kpi_btn_presenciales"):
             st.session_state["kpi_open"] = "presenciales"
 
@@ -1289,24 +1661,24 @@ def main():
         st.subheader("📌 Detalle KPI")
 
         if kpi_open == "entradas":
-            df = oper_foco[oper_foco["Estado"].isin(["ENTRADA", "ENTRADA+SALIDA"])].copy()
-            _kpi_table(df, f"Entradas · {pd.to_datetime(foco_day).strftime('%d/%m/%Y')}", "entradas")
+            df = oper_foco[oper_foco["Estado"].isin(["ENTRADA", "ENTRADA+SALIDA"])]
+            _kpi_table(df, f"Entradas · {foco_label}", "entradas")
 
         elif kpi_open == "salidas":
-            df = oper_foco[oper_foco["Estado"].isin(["SALIDA", "ENTRADA+SALIDA"])].copy()
-            _kpi_table(df, f"Salidas · {pd.to_datetime(foco_day).strftime('%d/%m/%Y')}", "salidas")
+            df = oper_foco[oper_foco["Estado"].isin(["SALIDA", "ENTRADA+SALIDA"])]
+            _kpi_table(df, f"Salidas · {foco_label}", "salidas")
 
         elif kpi_open == "turnovers":
-            df = oper_foco[oper_foco["Estado"].isin(["ENTRADA+SALIDA"])].copy()
-            _kpi_table(df, f"Turnovers · {pd.to_datetime(foco_day).strftime('%d/%m/%Y')}", "turnovers")
+            df = oper_foco[oper_foco["Estado"].isin(["ENTRADA+SALIDA"])]
+            _kpi_table(df, f"Turnovers · {foco_label}", "turnovers")
 
         elif kpi_open == "ocupados":
-            df = oper_foco[oper_foco["Estado"].isin(["OCUPADO"])].copy()
-            _kpi_table(df, f"Ocupados · {pd.to_datetime(foco_day).strftime('%d/%m/%Y')}", "ocupados")
+            df = oper_foco[oper_foco["Estado"].isin(["OCUPADO"])]
+            _kpi_table(df, f"Ocupados · {foco_label}", "ocupados")
 
         elif kpi_open == "vacios":
-            df = oper_foco[oper_foco["Estado"].isin(["VACIO"])].copy()
-            _kpi_table(df, f"Vacíos · {pd.to_datetime(foco_day).strftime('%d/%m/%Y')}", "vacios")
+            df = oper_foco[oper_foco["Estado"].isin(["VACIO"])]
+            _kpi_table(df, f"Vacíos · {foco_label}", "vacios")
 
         elif kpi_open == "presenciales":
             _kpi_table(pres_df, f"Check-ins presenciales · {pres_label}", "presenciales")
@@ -1320,17 +1692,7 @@ def main():
     st.subheader("🔎 Buscar apartamento · Resumen (Limpieza + Operativa + Reposición)")
     st.caption("Selecciona uno o varios apartamentos del listado (es buscable).")
 
-    apt_options = []
-    try:
-        apt_options = (
-            masters["apt_almacen"]["APARTAMENTO"].dropna().astype(str).str.strip().tolist()
-            if "apt_almacen" in masters and "APARTAMENTO" in masters["apt_almacen"].columns
-            else []
-        )
-    except Exception:
-        apt_options = []
-
-    apt_options = sorted([a for a in apt_options if a and a.lower() not in {"nan", "none"}])
+    apt_options = _cached_apt_options()
 
     if "apt_selected" not in st.session_state:
         st.session_state["apt_selected"] = []
@@ -1350,7 +1712,7 @@ def main():
         if last_view is None or last_view.empty:
             st.info("No hay datos de limpieza disponibles.")
         else:
-            one = last_view[last_view["APARTAMENTO_KEY"].isin(apt_keys_sel)].copy()
+            one = last_view[last_view["APARTAMENTO_KEY"].isin(apt_keys_sel)]
             if one.empty:
                 st.info("No encuentro último informe para esos apartamentos en la Sheet.")
             else:
@@ -1359,17 +1721,19 @@ def main():
                 st.dataframe(one[show_cols].reset_index(drop=True), use_container_width=True, height="content")
 
         st.markdown("### 🧾 Parte Operativo (apartamentos seleccionados)")
-        op_one = oper_all[oper_all["APARTAMENTO_KEY"].isin(apt_keys_sel)].copy()
+        op_one = oper_all[oper_all["APARTAMENTO_KEY"].isin(apt_keys_sel)]
         if op_one.empty:
             st.info("No hay filas de operativa para esos apartamentos en el periodo seleccionado.")
         else:
+            mask = pd.Series(True, index=op_one.index)
             if zonas_sel:
-                op_one = op_one[op_one["ZONA"].isin(zonas_sel)].copy()
+                mask &= op_one["ZONA"].isin(zonas_sel)
             if estados_sel:
-                op_one = op_one[op_one["Estado"].isin(estados_sel)].copy()
+                mask &= op_one["Estado"].isin(estados_sel)
 
-            op_one = op_one.sort_values(["Día", "ZONA", "__prio", "APARTAMENTO"], ascending=[True, True, True, True])
-            op_show = op_one.drop(columns=["APARTAMENTO_KEY"], errors="ignore").copy()
+            op_one = op_one[mask]
+            op_one = op_one.iloc[_lexsort_order(op_one, ["Día", "ZONA", "__prio", "APARTAMENTO"])]
+            op_show = op_one.drop(columns=["APARTAMENTO_KEY"], errors="ignore")
             _render_operativa_table(op_show, key="apt_oper_multiselect", styled=True)
 
         st.markdown("### 📦 Reposición (apartamentos seleccionados)")
@@ -1377,15 +1741,11 @@ def main():
             st.info("Sin reposición (no hay operativa para esos apartamentos).")
         else:
             cols_rep = [c for c in ["Lista_reponer", "Completar con"] if c in op_one.columns]
-            rep_rows = op_one[cols_rep + ["Día", "ZONA", "APARTAMENTO"]].copy() if cols_rep else pd.DataFrame()
+            rep_rows = op_one[cols_rep + ["Día", "ZONA", "APARTAMENTO"]] if cols_rep else pd.DataFrame()
             if rep_rows.empty:
                 st.info("No veo columnas de reposición en la operativa para esos apartamentos.")
             else:
-                rep_rows["has_rep"] = rep_rows[cols_rep].astype(str).apply(
-                    lambda r: any(x.strip().lower() not in {"", "nan", "none"} for x in r),
-                    axis=1,
-                )
-                rep_rows = rep_rows[rep_rows["has_rep"]].drop(columns=["has_rep"], errors="ignore")
+                rep_rows = rep_rows[_has_any_text(rep_rows, cols_rep)]
                 if rep_rows.empty:
                     st.info("No hay reposición indicada para esos apartamentos en el periodo.")
                 else:
@@ -1395,7 +1755,7 @@ def main():
 
     st.download_button(
         "⬇️ Descargar Excel (Operativa)",
-        data=dash["excel_all"],
+        data=dash["excel_all_fn"],
         file_name=dash["excel_filename"],
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
@@ -1407,34 +1767,38 @@ def main():
     st.subheader("PARTE OPERATIVO · Entradas / Salidas / Ocupación / Vacíos + Reposición")
     st.caption(f"Periodo: {dash['period_start']} → {dash['period_end']} · Prioridad: Entradas arriba · Agrupado por ZONA")
 
-    operativa = dash["operativa"].copy()
-    operativa["APARTAMENTO_KEY"] = operativa["APARTAMENTO"].map(_apt_key)
+    operativa = dash["operativa"].assign(APARTAMENTO_KEY=lambda d: _apt_key_series(d["APARTAMENTO"]))
     operativa = enrich_operativa_with_guest_fields(operativa, avantio_df)
     operativa = add_whatsapp_links_to_df(operativa, wa_master)
     operativa = add_cleaning_ready_columns(operativa, cleaning_master, lookback_days=CLEAN_READY_LOOKBACK_DAYS)
 
+    mask = pd.Series(True, index=operativa.index)
     if zonas_sel:
-        operativa = operativa[operativa["ZONA"].isin(zonas_sel)].copy()
+        mask &= operativa["ZONA"].isin(zonas_sel)
     if estados_sel:
-        operativa = operativa[operativa["Estado"].isin(estados_sel)].copy()
-
-    operativa = operativa.sort_values(["Día", "ZONA", "__prio", "APARTAMENTO"])
-
-    for dia, ddf in operativa.groupby("Día", dropna=False):
-        st.markdown(f"### Día {pd.to_datetime(dia).strftime('%d/%m/%Y')}")
-        if ddf.empty:
-            st.info("Sin datos.")
-            continue
-
-        for zona, zdf in ddf.groupby("ZONA", dropna=False):
-            zona_label = zona if zona not in [None, "None", "", "nan"] else "Sin zona"
-            st.markdown(f"#### {zona_label}")
-            show_df = zdf.drop(columns=["ZONA", "__prio", "APARTAMENTO_KEY"], errors="ignore").copy()
-            _render_operativa_table(
-                show_df,
-                key=f"oper_{pd.to_datetime(dia).strftime('%Y%m%d')}_{_apt_key(str(zona_label))}",
-                styled=True,
-            )
+        mask &= operativa["Estado"].isin(estados_sel)
+    operativa = operativa[mask]
+
+    operativa = operativa.iloc[_lexsort_order(operativa, ["Día", "ZONA", "__prio", "APARTAMENTO"])]
+
+    # Ya viene ordenado por (Día, ZONA): cada grupo es un tramo contiguo. Todas las
+    # zonas comparten columnas: column_config una sola vez para todo el parte
+    show_cfg = _operativa_column_config(operativa.columns.drop(["ZONA", "__prio", "APARTAMENTO_KEY"], errors="ignore"))
+    prev_dia = object()
+    for (dia, zona), zdf in _contiguous_groups(operativa, ["Día", "ZONA"]):
+        if dia != prev_dia:
+            st.markdown(f"### Día {dia.strftime('%d/%m/%Y')}")
+            prev_dia = dia
+
+        zona_label = zona if zona not in [None, "None", "", "nan"] else "Sin zona"
+        st.markdown(f"#### {zona_label}")
+        show_df = zdf.drop(columns=["ZONA", "__prio", "APARTAMENTO_KEY"], errors="ignore")
+        _render_operativa_table(
+            show_df,
+            key=f"oper_{dia.strftime('%Y%m%d')}_{_apt_key(str(zona_label))}",
+            styled=True,
+            colcfg=show_cfg,
+        )
 
     # =========================
     # SUGERENCIA DE REPOSICIÓN
@@ -1470,35 +1834,43 @@ def main():
     tomorrow = (pd.Timestamp(today_real) + pd.Timedelta(days=1)).date()
     visitable_states = {"VACIO", "ENTRADA", "ENTRADA+SALIDA"}
 
-    route_df = dash["operativa"].copy()
-    route_df = route_df[route_df["Día"].isin([today_real, tomorrow])].copy()
-    route_df = route_df[route_df["Estado"].isin(visitable_states)].copy()
-    route_df = route_df[route_df["Lista_reponer"].astype(str).str.strip().ne("")].copy()
-
-    if zonas_sel:
-        route_df = route_df[route_df["ZONA"].isin(zonas_sel)].copy()
+    route_df = dash["operativa"]
+    if coord_map:
+        mask = (
+            route_df["Día"].isin([today_real, tomorrow])
+            & route_df["Estado"].isin(visitable_states)
+            & route_df["Lista_reponer"].fillna("").str.len().gt(0)
+        )
+        if zonas_sel:
+            mask &= route_df["ZONA"].isin(zonas_sel)
 
-    route_df = route_df.merge(ap_map[["APARTAMENTO", "LAT", "LNG"]], on="APARTAMENTO", how="left")
-    route_df["COORD"] = route_df.apply(lambda r: _coord_str(r.get("LAT"), r.get("LNG")), axis=1)
-    route_df = route_df[route_df["COORD"].notna()].copy()
+        route_df = route_df[mask].assign(COORD=lambda d: d["APARTAMENTO"].map(coord_map))
+        route_df = route_df[route_df["COORD"].notna()]
+    else:
+        # maestro sin ninguna coordenada: ni filtros ni agrupación
+        route_df = route_df.iloc[:0]
 
     if route_df.empty:
         st.info("No hay apartamentos visitables con reposición para HOY/MAÑANA (o faltan coordenadas).")
     else:
         MAX_STOPS = 20
-        for dia, ddf in route_df.groupby("Día", dropna=False):
-            st.markdown(f"### {pd.to_datetime(dia).strftime('%d/%m/%Y')}")
-            for zona, zdf in ddf.groupby("ZONA", dropna=False):
-                zona_label = zona if zona not in [None, "None", "", "nan"] else "Sin zona"
-                coords = zdf["COORD"].tolist()
-                if not coords:
-                    st.info(f"{zona_label}: sin coordenadas suficientes.")
-                    continue
-
-                for idx, chunk in enumerate(chunk_list(coords, MAX_STOPS), start=1):
-                    url = build_gmaps_directions_url(chunk, travelmode=travelmode, return_to_base=return_to_base)
-                    if url:
-                        st.link_button(f"Abrir ruta · {zona_label} (tramo {idx})", url)
+        prev_dia = object()
+        for (dia, zona), zdf in route_df.groupby(["Día", "ZONA"], dropna=False, observed=True):
+            if dia != prev_dia:
+                st.markdown(f"### {dia.strftime('%d/%m/%Y')}")
+                prev_dia = dia
+
+            zona_label = zona if zona not in [None, "None", "", "nan"] else "Sin zona"
+            # dedup por zona antes de trocear: cada tramo sale con paradas distintas
+            coords = zdf["COORD"].unique().tolist()
+            if not coords:
+                st.info(f"{zona_label}: sin coordenadas suficientes.")
+                continue
+
+            for idx, chunk in enumerate(chunk_list(coords, MAX_STOPS), start=1):
+                url = build_gmaps_directions_url(chunk, travelmode=travelmode, return_to_base=return_to_base)
+                if url:
+                    st.link_button(f"Abrir ruta · {zona_label} (tramo {idx})", url)
 
     with st.expander("🧪 Debug reposición (por almacén)", expanded=False):
         st.caption("Comprueba Min/Max/Stock y el cálculo final.")
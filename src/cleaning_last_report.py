@@ -1,21 +1,19 @@
 # src/parsers/cleaning_last_report.py
 import re
-from datetime import datetime
+import unicodedata
 import pandas as pd
 
+_COMBINING_RX = re.compile(r"[\u0300-\u036f]")
+
 
 def _normalize_apt(s: str) -> str:
     if s is None:
         return ""
     s = str(s).strip()
 
-    # Normalización rápida (acentos básicos + espacios)
-    repl = {
-        "á": "a", "é": "e", "í": "i", "ó": "o", "ú": "u", "ñ": "n",
-        "Á": "A", "É": "E", "Í": "I", "Ó": "O", "Ú": "U", "Ñ": "N",
-    }
-    for a, b in repl.items():
-        s = s.replace(a, b)
+    # Quita acentos en una pasada (NFD + marcas combinantes), cubre cualquier tilde
+    if not s.isascii():
+        s = _COMBINING_RX.sub("", unicodedata.normalize("NFD", s))
 
     s = re.sub(r"\s+", " ", s)
 
@@ -25,21 +23,24 @@ def _normalize_apt(s: str) -> str:
     return s.upper().strip()
 
 
-def _parse_timestamp(x):
-    if pd.isna(x):
-        return pd.NaT
-    if isinstance(x, datetime):
-        return x
-    s = str(x).strip()
+# Formatos habituales de Google Forms
+_TS_FORMATS = ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%Y-%m-%d %H:%M:%S")
 
-    # Formatos habituales de Google Forms
-    for fmt in ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%Y-%m-%d %H:%M:%S"):
-        try:
-            return datetime.strptime(s, fmt)
-        except Exception:
-            pass
 
-    return pd.to_datetime(s, errors="coerce", dayfirst=True)
+def _parse_timestamps(col: pd.Series) -> pd.Series:
+    """
+    Un to_datetime por formato sobre toda la columna; lo que no encaje en ninguno
+    se interpreta elemento a elemento (dayfirst), como hacía el parseo fila a fila.
+    """
+    txt = col.astype(str).str.strip()
+    out = pd.to_datetime(txt, format=_TS_FORMATS[0], errors="coerce")
+    for fmt in _TS_FORMATS[1:]:
+        out = out.fillna(pd.to_datetime(txt, format=fmt, errors="coerce"))
+
+    rest = out.isna() & col.notna()
+    if rest.any():
+        out[rest] = pd.to_datetime(txt[rest], errors="coerce", dayfirst=True, format="mixed")
+    return out
 
 
 def _find_col(df: pd.DataFrame, exact: str, fallback_pattern: str | None = None) -> str | None:
@@ -100,7 +101,7 @@ def build_last_report_view(df: pd.DataFrame) -> pd.DataFrame:
         apt_final = apt
 
     tmp["_apt_norm"] = apt_final.map(_normalize_apt)
-    tmp["_ts"] = tmp[col_ts].map(_parse_timestamp)
+    tmp["_ts"] = _parse_timestamps(tmp[col_ts])
 
     tmp = tmp.dropna(subset=["_ts"])
     tmp = tmp.sort_values("_ts")
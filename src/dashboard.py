@@ -1,4 +1,6 @@
+import numpy as np
 import pandas as pd
+from functools import partial
 from io import BytesIO
 
 STATE_PRIORITY = {
@@ -87,28 +89,27 @@ def _build_list_per_apt(apt_df: pd.DataFrame, rep_df: pd.DataFrame, col_name: st
         rep["Amenity"] = rep["AmenityKey"].astype(str)
 
     tmp = out[["APARTAMENTO", "ALMACEN", "CAFE_TIPO"]].merge(rep, on="ALMACEN", how="left")
-    tmp = tmp.dropna(subset=["AmenityKey"]).copy()
-
-    def keep_row(r):
-        k = str(r.get("AmenityKey") or "")
-        if not k:
-            return False
-        if k in COFFEE_KEYS:
-            allowed = _coffee_allowed_keys(r.get("CAFE_TIPO"))
-            return k in allowed
-        return True
-
-    tmp = tmp[tmp.apply(keep_row, axis=1)].copy()
+    tmp = tmp.dropna(subset=["AmenityKey"])
+
+    # Café: solo la clave compatible con el CAFE_TIPO (se evalúa una vez por tipo distinto;
+    # _coffee_allowed_keys devuelve como mucho una clave)
+    key = tmp["AmenityKey"].astype(str)
+    codes, tipos = pd.factorize(tmp["CAFE_TIPO"])
+    allowed = np.array([next(iter(_coffee_allowed_keys(t)), None) for t in tipos] + [None], dtype=object)
+    cafe_ok = key.to_numpy(dtype=object) == allowed[codes]
+
+    tmp = tmp[key.ne("") & (~key.isin(COFFEE_KEYS) | cafe_ok)].copy()
     if tmp.empty:
         return out
 
     tmp["qty"] = pd.to_numeric(tmp["A_reponer"], errors="coerce").fillna(0).round(0).astype(int)
     tmp = tmp[tmp["qty"] > 0].copy()
 
-    tmp["item"] = tmp.apply(lambda r: f"{r.get('Amenity','')} x{int(r['qty'])}", axis=1)
+    tmp["item"] = tmp["Amenity"].map(str) + " x" + tmp["qty"].astype(str)
 
+    # el resultado se vuelve a unir por merge: el orden de grupos no importa
     agg = (
-        tmp.groupby("APARTAMENTO")["item"]
+        tmp.groupby("APARTAMENTO", sort=False)["item"]
         .agg(lambda s: ", ".join([x for x in s.tolist() if isinstance(x, str) and x.strip()])[:60])
         .reset_index()
         .rename(columns={"item": col_name})
@@ -138,8 +139,8 @@ def _diff_rep(rep_all: pd.DataFrame, rep_urgent: pd.DataFrame) -> pd.DataFrame:
         if "AmenityKey" in df.columns:
             df["AmenityKey"] = df["AmenityKey"].astype(str).str.strip()
 
-    a = a.dropna(subset=["ALMACEN", "AmenityKey"]).copy()
-    u = u.dropna(subset=["ALMACEN", "AmenityKey"]).copy()
+    a = a.dropna(subset=["ALMACEN", "AmenityKey"])
+    u = u.dropna(subset=["ALMACEN", "AmenityKey"])
 
     u = u[["ALMACEN", "AmenityKey", "A_reponer"]].groupby(["ALMACEN", "AmenityKey"], as_index=False)["A_reponer"].sum()
     a = a[["ALMACEN", "AmenityKey", "A_reponer"]].groupby(["ALMACEN", "AmenityKey"], as_index=False)["A_reponer"].sum()
@@ -160,16 +161,40 @@ def _diff_rep(rep_all: pd.DataFrame, rep_urgent: pd.DataFrame) -> pd.DataFrame:
     return m[["ALMACEN", "AmenityKey", "Amenity", "A_reponer"]]
 
 
-def build_dashboard_frames(
-    avantio_df: pd.DataFrame,
-    replenishment_df: pd.DataFrame,           # lo que usas como "rep" (puede ser urgente)
+def build_operativa_excel(
+    operativa: pd.DataFrame,
+    replenishment_df: pd.DataFrame | None = None,
+    rep_all_df: pd.DataFrame | None = None,
     unclassified_products: pd.DataFrame | None = None,
-    period_start=None,
-    period_days: int = 2,
-    rep_all_df: pd.DataFrame | None = None,   # reposición completa (hasta máximo)
-    urgent_only: bool = False,                # si está activo, generamos "Completar con"
-    base_apts: pd.DataFrame | None = None,    # NUEVO: base de apartamentos (masters)
-) -> dict:
+) -> bytes:
+    """Excel de descarga: Operativa + reposición usada/completa + sin clasificar."""
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        operativa.to_excel(writer, sheet_name="Operativa", index=False)
+        if replenishment_df is not None and not replenishment_df.empty:
+            replenishment_df.to_excel(writer, sheet_name="Reposicion_usada", index=False)
+        if rep_all_df is not None and not rep_all_df.empty:
+            rep_all_df.to_excel(writer, sheet_name="Reposicion_completa", index=False)
+        if unclassified_products is not None and not unclassified_products.empty:
+            unclassified_products.to_excel(writer, sheet_name="Sin_clasificar", index=False)
+        for sh in writer.sheets.values():
+            sh.freeze_panes(1, 0)
+
+    return output.getvalue()
+
+
+def prepare_dashboard_base(
+    avantio_df: pd.DataFrame,
+    replenishment_df: pd.DataFrame,
+    rep_all_df: pd.DataFrame | None = None,
+    urgent_only: bool = False,
+    base_apts: pd.DataFrame | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Parte de build_dashboard_frames que no depende del periodo: reservas con
+    fechas/cliente ya parseados y base de apartamentos con Lista_reponer /
+    Completar con. Devuelve (reservas, base); se puede cachear aparte.
+    """
     df = avantio_df.copy()
 
     # Asegura columnas fecha
@@ -192,12 +217,6 @@ def build_dashboard_frames(
     else:
         df["CLIENTE"] = ""
 
-    # Periodo
-    start = pd.Timestamp(period_start).normalize() if period_start is not None else pd.Timestamp.today().normalize()
-    days = max(1, int(period_days))
-    date_list = [start + pd.Timedelta(days=i) for i in range(days)]
-    end = (start + pd.Timedelta(days=days - 1)).normalize()
-
     # Base apartments
     base_cols = ["APARTAMENTO", "ZONA", "CAFE_TIPO", "ALMACEN"]
     for c in base_cols:
@@ -228,18 +247,42 @@ def build_dashboard_frames(
         rep_rest = _diff_rep(rep_all_df, replenishment_df)
         base = _build_list_per_apt(base, rep_rest, "Completar con")
 
+    return df, base
+
+
+def build_dashboard_frames(
+    avantio_df: pd.DataFrame,
+    replenishment_df: pd.DataFrame,           # lo que usas como "rep" (puede ser urgente)
+    unclassified_products: pd.DataFrame | None = None,
+    period_start=None,
+    period_days: int = 2,
+    rep_all_df: pd.DataFrame | None = None,   # reposición completa (hasta máximo)
+    urgent_only: bool = False,                # si está activo, generamos "Completar con"
+    base_apts: pd.DataFrame | None = None,    # NUEVO: base de apartamentos (masters)
+    prepared: tuple[pd.DataFrame, pd.DataFrame] | None = None,  # salida de prepare_dashboard_base
+) -> dict:
+    if prepared is None:
+        prepared = prepare_dashboard_base(avantio_df, replenishment_df, rep_all_df, urgent_only, base_apts)
+    df, base = prepared
+
+    # Periodo
+    start = pd.Timestamp(period_start).normalize() if period_start is not None else pd.Timestamp.today().normalize()
+    days = max(1, int(period_days))
+    date_list = [start + pd.Timedelta(days=i) for i in range(days)]
+    end = (start + pd.Timedelta(days=days - 1)).normalize()
+
     oper_rows = []
 
     for d in date_list:
         day_start = d
         day_end = d + pd.Timedelta(days=1)
 
-        # Reservas activas en ese día
-        day_res = df[(df["in_dt"] < day_end) & (df["out_dt"] > day_start)].copy()
+        # Reservas activas en ese día (solo lectura: sin copia; sort/merge ya devuelven frames nuevos)
+        day_res = df[(df["in_dt"] < day_end) & (df["out_dt"] > day_start)]
 
         # Entradas y salidas “en el día”
-        in_today = df[df["in_dt"].dt.normalize() == day_start][["APARTAMENTO", "in_dt", "CLIENTE"]].copy()
-        out_today = df[df["out_dt"].dt.normalize() == day_start][["APARTAMENTO", "out_dt", "CLIENTE"]].copy()
+        in_today = df.loc[df["in_dt"].dt.normalize() == day_start, ["APARTAMENTO", "in_dt", "CLIENTE"]]
+        out_today = df.loc[df["out_dt"].dt.normalize() == day_start, ["APARTAMENTO", "out_dt", "CLIENTE"]]
 
         in_today = in_today.sort_values("in_dt").drop_duplicates("APARTAMENTO")
         out_today = out_today.sort_values("out_dt").drop_duplicates("APARTAMENTO")
@@ -263,7 +306,7 @@ def build_dashboard_frames(
         if not day_res.empty:
             tmp = day_res[["APARTAMENTO", "in_dt", "CLIENTE"]].copy()
             tmp["CLIENTE"] = tmp["CLIENTE"].astype(str).str.strip()
-            tmp = tmp[tmp["CLIENTE"].str.strip().ne("")].copy()
+            tmp = tmp[tmp["CLIENTE"].str.strip().ne("")]
             if not tmp.empty:
                 tmp = tmp.sort_values(["APARTAMENTO", "in_dt"], ascending=[True, False]).drop_duplicates("APARTAMENTO")
                 occ_client = tmp[["APARTAMENTO", "CLIENTE"]].rename(columns={"CLIENTE": "CLIENTE_OCUPA"})
@@ -284,7 +327,8 @@ def build_dashboard_frames(
             return "VACIO"
 
         day_table["Estado"] = day_table.apply(compute_state, axis=1)
-        day_table["__prio"] = day_table["Estado"].map(lambda x: STATE_PRIORITY.get(x, 99))
+        # prioridad como int8 con un map de dict (sin lambda por fila): el orden final va por códigos
+        day_table["__prio"] = day_table["Estado"].map(STATE_PRIORITY).fillna(99).astype(np.int8)
 
         # NUEVO orden de preferencia:
         # 1) si entra hoy -> cliente entrada
@@ -302,7 +346,7 @@ def build_dashboard_frames(
         day_table["Cliente"] = day_table.apply(pick_cliente, axis=1)
 
         # Próxima entrada
-        future_in = df[df["in_dt"] > day_end][["APARTAMENTO", "in_dt"]].copy()
+        future_in = df.loc[df["in_dt"] > day_end, ["APARTAMENTO", "in_dt"]]
         future_in = future_in.sort_values("in_dt").drop_duplicates("APARTAMENTO")
         future_in["Próxima Entrada"] = future_in["in_dt"].dt.date
         future_in = future_in[["APARTAMENTO", "Próxima Entrada"]]
@@ -324,39 +368,33 @@ def build_dashboard_frames(
         for c in keep_cols:
             if c not in day_table.columns:
                 day_table[c] = ""
-        day_table = day_table[keep_cols].copy()
+        day_table = day_table[keep_cols]  # pd.concat copia al final; sin copia por día
 
         oper_rows.append(day_table)
 
     operativa = pd.concat(oper_rows, ignore_index=True)
 
+    # Día/Estado/ZONA como category: isin, sort y groupby trabajan sobre códigos enteros
+    for c in ("Día", "Estado", "ZONA"):
+        operativa[c] = operativa[c].astype("category")
+
     foco = start.date()
-    foco_df = operativa[operativa["Día"] == foco]
+    # Un solo conteo por Estado; los KPI salen ya como int de Python
+    n_estado = operativa.loc[operativa["Día"] == foco, "Estado"].value_counts().to_dict()
     kpis = {
-        "entradas_dia": int((foco_df["Estado"] == "ENTRADA").sum()),
-        "salidas_dia": int((foco_df["Estado"] == "SALIDA").sum()),
-        "turnovers_dia": int((foco_df["Estado"] == "ENTRADA+SALIDA").sum()),
-        "ocupados_dia": int((foco_df["Estado"] == "OCUPADO").sum()),
-        "vacios_dia": int((foco_df["Estado"] == "VACIO").sum()),
+        "entradas_dia": int(n_estado.get("ENTRADA", 0)),
+        "salidas_dia": int(n_estado.get("SALIDA", 0)),
+        "turnovers_dia": int(n_estado.get("ENTRADA+SALIDA", 0)),
+        "ocupados_dia": int(n_estado.get("OCUPADO", 0)),
+        "vacios_dia": int(n_estado.get("VACIO", 0)),
     }
 
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        operativa.to_excel(writer, sheet_name="Operativa", index=False)
-        if replenishment_df is not None and not replenishment_df.empty:
-            replenishment_df.to_excel(writer, sheet_name="Reposicion_usada", index=False)
-        if rep_all_df is not None and not rep_all_df.empty:
-            rep_all_df.to_excel(writer, sheet_name="Reposicion_completa", index=False)
-        if unclassified_products is not None and not unclassified_products.empty:
-            unclassified_products.to_excel(writer, sheet_name="Sin_clasificar", index=False)
-        for sh in writer.sheets.values():
-            sh.freeze_panes(1, 0)
-
     return {
         "kpis": kpis,
         "operativa": operativa,
         "period_start": start.date(),
         "period_end": end.date(),
-        "excel_all": output.getvalue(),
+        # el xlsx se genera al pulsar descargar (st.download_button acepta un callable)
+        "excel_all_fn": partial(build_operativa_excel, operativa, replenishment_df, rep_all_df, unclassified_products),
         "excel_filename": f"Florit_OPS_Operativa_{start.date()}_{end.date()}.xlsx",
     }
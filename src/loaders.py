@@ -2,9 +2,15 @@
 from __future__ import annotations
 
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import os
 import re
 import pandas as pd
 
+logger = logging.getLogger(__name__)
+
 
 def _repo_root() -> Path:
     return Path(__file__).resolve().parents[1]
@@ -14,18 +20,25 @@ def _data_dir() -> Path:
     return _repo_root() / "data"
 
 
+# calamine (Rust) si está instalado; si no, openpyxl como siempre
+try:
+    import python_calamine  # noqa: F401
+
+    _EXCEL_ENGINE = "calamine"
+except ImportError:
+    _EXCEL_ENGINE = "openpyxl"
+
+
 def _read_excel_first_sheet(path: Path) -> pd.DataFrame:
-    return pd.read_excel(path, sheet_name=0, engine="openpyxl")
+    return pd.read_excel(path, sheet_name=0, engine=_EXCEL_ENGINE)
 
 
 def _norm_cols(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df.columns = [str(c).strip() for c in df.columns]
-    return df
+    return df.set_axis(list(map(str.strip, map(str, df.columns))), axis=1)
 
 
 def _find_col(df: pd.DataFrame, candidates: list[str]) -> str | None:
-    cols = {str(c).strip().lower(): str(c).strip() for c in df.columns}
+    cols = {c.lower(): c for c in map(str.strip, map(str, df.columns))}
     for cand in candidates:
         k = cand.strip().lower()
         if k in cols:
@@ -33,35 +46,46 @@ def _find_col(df: pd.DataFrame, candidates: list[str]) -> str | None:
     return None
 
 
+_EXCEL_EXTS = frozenset({".xlsx", ".xls"})
+
+
 def _list_excel_files(d: Path) -> list[Path]:
-    files = []
-    files += list(d.glob("*.xlsx"))
-    files += list(d.glob("*.xls"))
+    # una sola pasada por el directorio (scandir reutiliza el tipo de entrada, sin stat extra)
+    with os.scandir(d) as it:
+        files = [
+            Path(e.path)
+            for e in it
+            if not e.name.startswith(".")
+            and os.path.splitext(e.name)[1].lower() in _EXCEL_EXTS
+            and e.is_file()
+        ]
     return sorted(files, key=lambda p: p.name.lower())
 
 
-def _best_match_file(d: Path, keywords: list[str]) -> Path | None:
+def _best_match_file(d: Path, keywords: list[str], files: list[Path] | None = None) -> Path | None:
     """
     Elige el archivo Excel del data/ que más encaja por keywords (sin obligar a renombrar).
+    `files` permite reutilizar un listado ya hecho de data/.
     """
-    files = _list_excel_files(d)
+    if files is None:
+        files = _list_excel_files(d)
     if not files:
         return None
 
+    kws = [kw.lower() for kw in keywords]
+
     def score(p: Path) -> int:
         name = p.name.lower()
-        s = 0
-        for kw in keywords:
-            if kw.lower() in name:
-                s += 10
+        s = 10 * sum(kw in name for kw in kws)
         if p.suffix.lower() == ".xlsx":
             s += 2
         return s
 
-    ranked = sorted(files, key=lambda p: score(p), reverse=True)
-    if score(ranked[0]) == 0:
+    # una puntuación por archivo; max() se queda con el primero en empate (como el sort estable)
+    best_score, best = max(((score(p), p) for p in files), key=lambda t: t[0])
+    if best_score == 0:
         return None
-    return ranked[0]
+    return best
 
 
 # =========================
@@ -70,21 +94,6 @@ def _best_match_file(d: Path, keywords: list[str]) -> Path | None:
 _COORD_RX = re.compile(r"^\s*([+-]?\d+(?:\.\d+)?)\s*,\s*([+-]?\d+(?:\.\d+)?)\s*$")
 
 
-def _split_coord_to_lat_lng(v):
-    if v is None:
-        return None, None
-    s = str(v).strip()
-    if not s or s.lower() in ("nan", "none"):
-        return None, None
-    m = _COORD_RX.match(s)
-    if not m:
-        return None, None
-    try:
-        return float(m.group(1)), float(m.group(2))
-    except Exception:
-        return None, None
-
-
 # --------------------------
 # LOADERS individuales
 # --------------------------
@@ -133,7 +142,7 @@ def _load_cafe(path: Path) -> pd.DataFrame:
         return out.drop_duplicates()
 
     # fallback si el excel viene sin headers reales
-    df2 = pd.read_excel(path, sheet_name=0, header=None, engine="openpyxl")
+    df2 = pd.read_excel(path, sheet_name=0, header=None, engine=_EXCEL_ENGINE)
     if df2.shape[1] >= 2:
         out = df2.iloc[:, :2].copy()
         out.columns = ["APARTAMENTO", "CAFE_TIPO"]
@@ -175,14 +184,10 @@ def _load_apt_almacen(path: Path) -> pd.DataFrame:
         out["Localizacion"] = ""
     out["Localizacion"] = out["Localizacion"].astype(str).str.strip()
 
-    # ✅ NUEVO: parsea Localizacion -> LAT/LNG (sin romper nada)
-    lats, lngs = [], []
-    for v in out["Localizacion"].tolist():
-        lat, lng = _split_coord_to_lat_lng(v)
-        lats.append(lat)
-        lngs.append(lng)
-    out["LAT"] = pd.to_numeric(pd.Series(lats), errors="coerce")
-    out["LNG"] = pd.to_numeric(pd.Series(lngs), errors="coerce")
+    # ✅ NUEVO: parsea Localizacion -> LAT/LNG (sin romper nada), toda la columna de una vez
+    coords = out["Localizacion"].str.extract(_COORD_RX)
+    out["LAT"] = coords[0].astype("float64")
+    out["LNG"] = coords[1].astype("float64")
 
     out = out[out["APARTAMENTO"].ne("") & out["APARTAMENTO"].ne("nan")]
     return out.drop_duplicates()
@@ -218,6 +223,71 @@ def _load_thresholds(path: Path) -> pd.DataFrame:
     return out.drop_duplicates()
 
 
+# --------------------------
+# Caché en disco (parquet) de los masters, por mtime/tamaño de los Excel
+# --------------------------
+_MASTERS_CACHE_VERSION = 1
+_MASTERS_FRAMES = ("zonas", "cafe", "apt_almacen", "thresholds")
+
+# El propio código del loader entra en la clave: cambiar la lógica de carga
+# invalida la caché sin tener que subir _MASTERS_CACHE_VERSION a mano
+_LOADER_SRC_DIGEST = hashlib.blake2b(Path(__file__).read_bytes(), digest_size=16).hexdigest()
+
+
+def _masters_cache_key(paths: list[Path | None]) -> str:
+    h = hashlib.blake2b(
+        f"v{_MASTERS_CACHE_VERSION}|{_LOADER_SRC_DIGEST}|{_EXCEL_ENGINE}|".encode(), digest_size=16
+    )
+    for p in paths:
+        if p is None:
+            h.update(b"-|")
+            continue
+        st = p.stat()
+        h.update(f"{p.name}:{st.st_mtime_ns}:{st.st_size}|".encode())
+    return h.hexdigest()
+
+
+def _masters_cache_dir() -> Path:
+    # fuera del repo: un deploy de solo lectura no debe escribir en data/
+    base = os.environ.get("XDG_CACHE_HOME") or (Path.home() / ".cache")
+    return Path(base) / "florit_ops_mvp" / "masters"
+
+
+# Errores esperables de la caché: IO/permisos, sin pyarrow, o columnas que Arrow no convierte
+_CACHE_ERRORS = (OSError, ImportError, ValueError, TypeError)
+
+
+def _read_masters_cache(cache_dir: Path, key: str) -> dict | None:
+    files = {n: cache_dir / f"{key}_{n}.parquet" for n in _MASTERS_FRAMES}
+    if not all(f.exists() for f in files.values()):
+        return None
+    try:
+        return {n: pd.read_parquet(f) for n, f in files.items()}
+    except _CACHE_ERRORS as e:
+        logger.warning("Caché de masters ilegible en %s: %s", cache_dir, e)
+        return None
+
+
+def _write_masters_cache(cache_dir: Path, key: str, masters: dict) -> None:
+    # caché opcional: si no se puede escribir se sigue sin ella (queda en el log)
+    tmp_files = {n: cache_dir / f".{key}_{n}.parquet.tmp" for n in _MASTERS_FRAMES}
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # todo a temporales primero: un fallo a mitad no deja un juego parcial con la clave buena
+        for n, tmp in tmp_files.items():
+            masters[n].to_parquet(tmp)
+        for n, tmp in tmp_files.items():
+            os.replace(tmp, cache_dir / f"{key}_{n}.parquet")
+        for old in cache_dir.glob("*.parquet"):
+            if not old.name.startswith(f"{key}_"):
+                old.unlink(missing_ok=True)
+    except _CACHE_ERRORS as e:
+        logger.warning("No se pudo escribir la caché de masters en %s: %s", cache_dir, e)
+    finally:
+        for tmp in tmp_files.values():
+            tmp.unlink(missing_ok=True)
+
+
 # --------------------------
 # MAIN: carga masters
 # --------------------------
@@ -226,22 +296,18 @@ def load_masters_repo() -> dict:
     if not d.exists():
         raise FileNotFoundError("No existe la carpeta data/ en el repo.")
 
-    # ✅ detección por keywords (no por nombre exacto)
-    zonas_path = _best_match_file(d, ["agrupacion", "agrupación", "zona"])
-    cafe_path = _best_match_file(d, ["cafe", "café", "apart"])
-    apt_path = _best_match_file(d, ["apartamentos", "inventarios"])
-    thr_path = _best_match_file(d, ["stock", "minimo", "mínimo", "almacen", "almacén"])
-
-    # zonas/café pueden faltar sin matar la app (se verá "Sin zona" y café vacío)
-    if zonas_path is None:
-        zonas = pd.DataFrame(columns=["APARTAMENTO", "ZONA"])
-    else:
-        zonas = _load_zonas(zonas_path)
+    # ✅ detección por keywords (no por nombre exacto); data/ se lista una sola vez
+    files = _list_excel_files(d)
+    zonas_path = _best_match_file(d, ["agrupacion", "agrupación", "zona"], files)
+    cafe_path = _best_match_file(d, ["cafe", "café", "apart"], files)
+    apt_path = _best_match_file(d, ["apartamentos", "inventarios"], files)
+    thr_path = _best_match_file(d, ["stock", "minimo", "mínimo", "almacen", "almacén"], files)
 
-    if cafe_path is None:
-        cafe = pd.DataFrame(columns=["APARTAMENTO", "CAFE_TIPO"])
-    else:
-        cafe = _load_cafe(cafe_path)
+    cache_dir = _masters_cache_dir()
+    cache_key = _masters_cache_key([zonas_path, cafe_path, apt_path, thr_path])
+    cached = _read_masters_cache(cache_dir, cache_key)
+    if cached is not None:
+        return cached
 
     # apt_almacen y thresholds sí son críticos para reposición y rutas
     if apt_path is None:
@@ -249,12 +315,24 @@ def load_masters_repo() -> dict:
     if thr_path is None:
         raise FileNotFoundError("No encuentro en data/ el Excel de THRESHOLDS (Stock mínimo por almacén).")
 
-    apt_almacen = _load_apt_almacen(apt_path)
-    thresholds = _load_thresholds(thr_path)
+    # Los cuatro Excel son independientes: se leen en paralelo (descompresión zip/IO solapados)
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        f_zonas = ex.submit(_load_zonas, zonas_path) if zonas_path is not None else None
+        f_cafe = ex.submit(_load_cafe, cafe_path) if cafe_path is not None else None
+        f_apt = ex.submit(_load_apt_almacen, apt_path)
+        f_thr = ex.submit(_load_thresholds, thr_path)
+
+        # zonas/café pueden faltar sin matar la app (se verá "Sin zona" y café vacío)
+        zonas = f_zonas.result() if f_zonas else pd.DataFrame(columns=["APARTAMENTO", "ZONA"])
+        cafe = f_cafe.result() if f_cafe else pd.DataFrame(columns=["APARTAMENTO", "CAFE_TIPO"])
+        apt_almacen = f_apt.result()
+        thresholds = f_thr.result()
 
-    return {
+    masters = {
         "zonas": zonas,
         "cafe": cafe,
         "apt_almacen": apt_almacen,
         "thresholds": thresholds,
     }
+    _write_masters_cache(cache_dir, cache_key, masters)
+    return masters
@@ -1,5 +1,6 @@
 import re
 import unicodedata
+from functools import lru_cache
 import pandas as pd
 
 
@@ -11,16 +12,20 @@ def _norm_txt(x) -> str:
     except Exception:
         return ""
     s = s.strip().lower()
-    s = "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+    if not s.isascii():  # el texto ASCII no tiene tildes que quitar
+        s = "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
     s = re.sub(r"\s+", " ", s)
     return s
 
 
+@lru_cache(maxsize=4096)
 def amenity_key(product_name: str) -> str | None:
     """
     Clave CANÓNICA para cruzar:
     - Odoo -> Producto real (nombres largos)
     - Thresholds -> Amenity/Producto (corto)
+
+    Memoizada: los mismos nombres se repiten entre Odoo, thresholds y reruns.
     """
     t = _norm_txt(product_name)
 
@@ -97,7 +102,7 @@ def normalize_products(odoo_df: pd.DataFrame) -> pd.DataFrame:
     Devuelve: AmenityKey + Amenity (display)
     """
     df = odoo_df.copy()
-    df.columns = [str(c).strip() for c in df.columns]
+    df.columns = list(map(str.strip, map(str, df.columns)))
 
     # Producto
     if "Producto" not in df.columns:
@@ -121,7 +126,9 @@ def normalize_products(odoo_df: pd.DataFrame) -> pd.DataFrame:
 
     df = df[df.get("Producto").notna()].copy()
 
-    df["AmenityKey"] = df["Producto"].apply(amenity_key)
+    # Clasifica cada nombre de producto una sola vez (Odoo repite mucho los nombres)
+    keys = {p: amenity_key(p) for p in df["Producto"].unique()}
+    df["AmenityKey"] = df["Producto"].map(keys)
     df["Amenity"] = df["AmenityKey"].map(DISPLAY_BY_KEY)
 
     if "Cantidad" in df.columns:
@@ -139,7 +146,7 @@ def _clean_thresholds(thresholds: pd.DataFrame) -> pd.DataFrame:
     Opcional: ALMACEN
     """
     thr = thresholds.copy()
-    thr.columns = [str(c).strip() for c in thr.columns]
+    thr.columns = list(map(str.strip, map(str, thr.columns)))
 
     # Normaliza nombres de columnas
     col_map = {}
@@ -209,7 +216,7 @@ def summarize_replenishment(
       - A_reponer (a máximo por defecto)
     """
     out = stock_by_alm.copy()
-    out.columns = [str(c).strip() for c in out.columns]
+    out.columns = list(map(str.strip, map(str, out.columns)))
 
     if "ALMACEN" not in out.columns:
         for alt in ["Ubicación", "Ubicacion", "Almacen", "Almacén", "Location"]:
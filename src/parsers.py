@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from io import BytesIO, StringIO
 import re
@@ -314,31 +315,40 @@ def _try_read_csv_with_sep(text: str, sep: str) -> pd.DataFrame | None:
         return None
 
 
-def _read_csv_robust(b: bytes) -> pd.DataFrame:
-    encodings = ["utf-8-sig", "utf-8", "cp1252", "latin-1"]
+def _decode_csv_bytes(b: bytes) -> str:
+    """
+    Decodifica una sola vez: BOM UTF-16, UTF-8 (con o sin BOM), cp1252 y latin-1 (nunca falla).
+    """
+    if b.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return b.decode("utf-16")
 
-    for enc in encodings:
+    for enc in ["utf-8-sig", "cp1252"]:
         try:
-            text = b.decode(enc)
+            return b.decode(enc)
         except UnicodeDecodeError:
             continue
+    return b.decode("latin-1")
 
-        seps = []
-        try:
-            sample = "\n".join(text.splitlines()[:20])
-            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
-            seps.append(dialect.delimiter)
-        except Exception:
-            pass
 
-        for sep in [";", ",", "\t", "|"]:
-            if sep not in seps:
-                seps.append(sep)
+def _read_csv_robust(b: bytes) -> pd.DataFrame:
+    text = _decode_csv_bytes(b)
 
-        for sep in seps:
-            df = _try_read_csv_with_sep(text, sep)
-            if df is not None and not df.empty:
-                return df
+    seps = []
+    try:
+        sample = "\n".join(text.splitlines()[:20])
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        seps.append(dialect.delimiter)
+    except Exception:
+        pass
+
+    for sep in [";", ",", "\t", "|"]:
+        if sep not in seps:
+            seps.append(sep)
+
+    for sep in seps:
+        df = _try_read_csv_with_sep(text, sep)
+        if df is not None and not df.empty:
+            return df
 
     raise ValueError("Avantio: no se pudo interpretar el CSV.")
 
@@ -380,26 +390,47 @@ def parse_avantio_entradas(uploaded_file) -> pd.DataFrame:
             ) from e2
 
 
-def parse_odoo_stock(uploaded_file) -> pd.DataFrame:
-    b = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read()
-    name = getattr(uploaded_file, "name", "") or ""
+_MANGLED_DUP_RX = re.compile(r"(.*)\.\d+")
+
+
+def _has_dup_header(columns: list) -> bool:
+    """Cabecera leída por pandas con nombres repetidos (renombrados a "X.1", "X.2"...)."""
+    names = set(map(str, columns))
+    for c in names:
+        m = _MANGLED_DUP_RX.fullmatch(c)
+        if m and m.group(1) in names:
+            return True
+    return False
 
+
+def _read_odoo_table(b: bytes, name: str, arrow_usecols: list[str] | None = None, **kwargs) -> pd.DataFrame:
     if name.lower().endswith(".csv"):
+        # lector multihilo de Arrow para la lectura de datos (no admite nrows ni
+        # usecols por posición: con usecols solo se intenta si llegan los nombres);
+        # si falla (encoding, comillas raras...) se sigue con el motor C
+        if "nrows" not in kwargs and ("usecols" not in kwargs or arrow_usecols):
+            arrow_kwargs = {**kwargs, "usecols": arrow_usecols} if arrow_usecols else kwargs
+            try:
+                df = pd.read_csv(BytesIO(b), engine="pyarrow", **arrow_kwargs)
+                # pandas 2 deja None en el texto ausente (el motor C pone NaN): mismo nulo
+                # para que astype(str) dé "nan" en ambos caminos
+                obj = df.columns[df.dtypes == object]
+                if len(obj):
+                    df[obj] = df[obj].where(df[obj].notna(), np.nan)
+                return df
+            except Exception:
+                pass
         try:
-            df = pd.read_csv(BytesIO(b))
+            return pd.read_csv(BytesIO(b), **kwargs)
         except Exception:
             text = b.decode("utf-8", errors="ignore")
-            df = pd.read_csv(StringIO(text), sep=None, engine="python")
-    else:
-        df = pd.read_excel(BytesIO(b))
-
-    if df is None or df.empty:
-        return pd.DataFrame()
+            return pd.read_csv(StringIO(text), sep=None, engine="python", **kwargs)
+    return pd.read_excel(BytesIO(b), **kwargs)
 
-    df.columns = _dedupe_columns(df.columns)
 
+def _detect_odoo_cols(columns: list[str]) -> tuple[str | None, str | None, str | None]:
     col_ubic = None
-    for c in df.columns:
+    for c in columns:
         if c.lower() in ["ubicación", "ubicacion", "location", "ubicacion/stock"]:
             col_ubic = c
             break
@@ -408,7 +439,7 @@ def parse_odoo_stock(uploaded_file) -> pd.DataFrame:
             break
 
     col_prod = None
-    for c in df.columns:
+    for c in columns:
         if c.lower() in ["producto", "product", "nombre producto", "product name"]:
             col_prod = c
             break
@@ -417,7 +448,7 @@ def parse_odoo_stock(uploaded_file) -> pd.DataFrame:
             break
 
     col_qty = None
-    for c in df.columns:
+    for c in columns:
         if c.lower() in ["cantidad", "quantity", "qty", "on hand", "disponible"]:
             col_qty = c
             break
@@ -425,6 +456,40 @@ def parse_odoo_stock(uploaded_file) -> pd.DataFrame:
             col_qty = c
             break
 
+    return col_ubic, col_prod, col_qty
+
+
+def parse_odoo_stock(uploaded_file) -> pd.DataFrame:
+    b = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read()
+    name = getattr(uploaded_file, "name", "") or ""
+
+    # 1) Solo cabecera (nrows=0) para detectar columnas; luego se parsean solo esas 3
+    df = None
+    try:
+        raw = list(_read_odoo_table(b, name, nrows=0).columns)
+        cols = _dedupe_columns(raw)
+        picked = _detect_odoo_cols(cols)
+        if all(picked):
+            pos = sorted(cols.index(c) for c in picked)
+            # Arrow solo acepta usecols por nombre: se pasan los de la cabecera
+            # original si no hay duplicados (pandas los renombra "X.1", Arrow no)
+            names = None if _has_dup_header(raw) else [raw[i] for i in pos]
+            df = _read_odoo_table(b, name, arrow_usecols=names, usecols=pos)
+            df.columns = [cols[i] for i in pos]
+    except Exception:
+        df = None
+
+    # 2) Fallback: lectura completa
+    if df is None:
+        df = _read_odoo_table(b, name)
+        if df is not None:
+            df.columns = _dedupe_columns(df.columns)
+
+    if df is None or df.empty:
+        return pd.DataFrame()
+
+    col_ubic, col_prod, col_qty = _detect_odoo_cols(list(df.columns))
+
     if not (col_ubic and col_prod and col_qty):
         raise ValueError(
             f"Odoo: no se detectan columnas. Encontradas={list(df.columns)} | "